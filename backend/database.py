@@ -1,71 +1,196 @@
 import os
+import logging
 from typing import Any, Dict, List, Optional
-from datetime import datetime
-from pymongo import MongoClient, ASCENDING
-from pymongo.collection import Collection
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
 
 DATABASE_URL = os.getenv("DATABASE_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "portfolio_pal")
+# Bump when the index set below changes so the next boot re-runs ensure_indexes
+INDEX_VERSION = 3
+INDEX_LOCK_SECONDS = 300
+# IndexOptionsConflict / IndexKeySpecsConflict: same keys already indexed with other options
+_INDEX_CONFLICT_CODES = (85, 86)
 
-_client = MongoClient(DATABASE_URL)
+logger = logging.getLogger(__name__)
+
+# (collection, keys, options); multi-key entries are compound indexes
+_INDEXES = [
+    ("user", [("email", ASCENDING)], {"unique": True}),
+    ("activity", [("user_id", ASCENDING), ("created_at", ASCENDING)], {}),
+    # Kept on purpose: walked backwards it serves the admin overview's newest-first listing
+    ("activity", [("created_at", ASCENDING)], {}),
+]
+# Left behind by the old per-key loop; the compound index's user_id prefix covers it
+_STALE_INDEXES = [("activity", "user_id_1")]
+
+# tz_aware so dates read back compare cleanly with now_ts()
+_client = AsyncIOMotorClient(DATABASE_URL, tz_aware=True)
 db = _client[DATABASE_NAME]
 
-# Ensure common indexes
-for name, keys in {
-    "user": [("email", ASCENDING)],
-    "activity": [("user_id", ASCENDING), ("created_at", ASCENDING)],
-    "passwordreset": [("token", ASCENDING), ("expires_at", ASCENDING)],
-}.items():
+
+# Ensure common indexes; awaited from the app's startup hook
+async def ensure_indexes() -> None:
+    meta = db["_meta"]
+    try:
+        done = await meta.find_one({"_id": "indexes", "v": INDEX_VERSION})
+        if done:
+            return
+        # Only one worker builds at a time; the lease expires so a killed worker doesn't block retries
+        now = now_ts()
+        await meta.find_one_and_update(
+            {"_id": "indexes", "$or": [{"lock_until": {"$exists": False}}, {"lock_until": {"$lt": now}}]},
+            {"$set": {"lock_until": now + timedelta(seconds=INDEX_LOCK_SECONDS)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The marker exists and another worker holds the lease
+        return
+    except PyMongoError:
+        # v stays unset, so the next startup retries
+        logger.exception("Could not claim the index build lock; skipping index build")
+        return
+
     try:
-        col = db[name]
-        for key, direction in keys:
-            col.create_index([(key, direction)], background=True, unique=True if key == "email" and name == "user" else False)
-    except Exception:
-        # Index creation is best-effort
-        pass
+        ok = await _build_indexes()
+    except ConnectionFailure:
+        logger.exception("Lost connection to Mongo during index build; will retry on next startup")
+        return
+    try:
+        if ok:
+            await meta.update_one({"_id": "indexes"}, {"$set": {"v": INDEX_VERSION, "updated_at": now_ts()}, "$unset": {"lock_until": ""}})
+        else:
+            # Leave the version unset so the next boot retries
+            logger.error("Index build for version %s incomplete; will retry on next startup", INDEX_VERSION)
+            await meta.update_one({"_id": "indexes"}, {"$unset": {"lock_until": ""}})
+    except PyMongoError:
+        logger.exception("Failed to update the index build marker")
+
+
+async def _build_indexes() -> bool:
+    ok = True
+    for name, keys, options in _INDEXES:
+        try:
+            await db[name].create_index(keys, background=True, **options)
+        except ConnectionFailure:
+            raise
+        except PyMongoError:
+            logger.exception("Failed to create index %s on %s", keys, name)
+            ok = False
+
+    for name, index_name in _STALE_INDEXES:
+        try:
+            await db[name].drop_index(index_name)
+        except OperationFailure as exc:
+            if exc.code != 27:  # IndexNotFound: already gone
+                logger.exception("Failed to drop stale index %s on %s", index_name, name)
+                ok = False
+        except ConnectionFailure:
+            raise
+        except PyMongoError:
+            logger.exception("Failed to drop stale index %s on %s", index_name, name)
+            ok = False
+
+    # Reset tokens are looked up by token only; the TTL index lets Mongo purge expired ones
+    ok = await _ensure_reset_token_index() and ok
+    ok = await _ensure_reset_ttl_index() and ok
+    return ok
+
+
+async def _ensure_reset_token_index() -> bool:
+    col: AsyncIOMotorCollection = db["passwordreset"]
+    try:
+        await col.create_index([("token", ASCENDING)], unique=True, background=True)
+        return True
+    except OperationFailure as exc:
+        if exc.code not in _INDEX_CONFLICT_CODES:
+            logger.exception("Failed to create unique passwordreset.token index")
+            return False
+    except ConnectionFailure:
+        raise
+    except PyMongoError:
+        logger.exception("Failed to create unique passwordreset.token index")
+        return False
+    # Older deployments have a non-unique token_1; replace it with the unique one
+    try:
+        await col.drop_index("token_1")
+        await col.create_index([("token", ASCENDING)], unique=True, background=True)
+        return True
+    except ConnectionFailure:
+        raise
+    except PyMongoError:
+        logger.exception("Failed to replace passwordreset.token index with a unique one")
+        return False
+
+
+async def _ensure_reset_ttl_index() -> bool:
+    try:
+        await db["passwordreset"].create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, background=True)
+        return True
+    except OperationFailure as exc:
+        if exc.code not in _INDEX_CONFLICT_CODES:
+            logger.exception("Failed to create passwordreset.expires_at TTL index")
+            return False
+    except ConnectionFailure:
+        raise
+    except PyMongoError:
+        logger.exception("Failed to create passwordreset.expires_at TTL index")
+        return False
+    # Older deployments have a plain expires_at_1; turn it into a TTL index in place
+    try:
+        await db.command("collMod", "passwordreset", index={"keyPattern": {"expires_at": 1}, "expireAfterSeconds": 0})
+        return True
+    except ConnectionFailure:
+        raise
+    except PyMongoError:
+        logger.exception("Failed to add TTL to existing passwordreset.expires_at index")
+        return False
 
 
 def now_ts() -> datetime:
-    return datetime.utcnow()
+    return datetime.now(timezone.utc)
 
 
-def create_document(collection_name: str, data: Dict[str, Any]) -> str:
-    col: Collection = db[collection_name]
+async def create_document(collection_name: str, data: Dict[str, Any]) -> str:
+    col: AsyncIOMotorCollection = db[collection_name]
     data = {**data, "created_at": data.get("created_at", now_ts()), "updated_at": data.get("updated_at", now_ts())}
-    res = col.insert_one(data)
+    res = await col.insert_one(data)
     return str(res.inserted_id)
 
 
-def update_document(collection_name: str, filter_dict: Dict[str, Any], update_dict: Dict[str, Any]) -> int:
-    col: Collection = db[collection_name]
+async def update_document(collection_name: str, filter_dict: Dict[str, Any], update_dict: Dict[str, Any]) -> int:
+    col: AsyncIOMotorCollection = db[collection_name]
     update_dict["updated_at"] = now_ts()
-    res = col.update_one(filter_dict, {"$set": update_dict})
+    res = await col.update_one(filter_dict, {"$set": update_dict})
     return res.modified_count
 
 
-def get_documents(collection_name: str, filter_dict: Optional[Dict[str, Any]] = None, limit: int = 100, sort: Optional[List] = None) -> List[Dict[str, Any]]:
-    col: Collection = db[collection_name]
-    cur = col.find(filter_dict or {})
+async def get_documents(collection_name: str, filter_dict: Optional[Dict[str, Any]] = None, limit: int = 100, sort: Optional[List] = None, projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    col: AsyncIOMotorCollection = db[collection_name]
+    cur = col.find(filter_dict or {}, projection)
     if sort:
         cur = cur.sort(sort)
     if limit:
         cur = cur.limit(int(limit))
     items: List[Dict[str, Any]] = []
-    for doc in cur:
-        doc["_id"] = str(doc["_id"])  # stringify
+    async for doc in cur:
+        if "_id" in doc:
+            doc["_id"] = str(doc["_id"])  # stringify
         items.append(doc)
     return items
 
 
-def get_one(collection_name: str, filter_dict: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    col: Collection = db[collection_name]
-    doc = col.find_one(filter_dict)
+async def get_one(collection_name: str, filter_dict: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    col: AsyncIOMotorCollection = db[collection_name]
+    doc = await col.find_one(filter_dict)
     if doc:
         doc["_id"] = str(doc["_id"])  # stringify
     return doc
 
 
-def delete_document(collection_name: str, filter_dict: Dict[str, Any]) -> int:
-    col: Collection = db[collection_name]
-    res = col.delete_one(filter_dict)
+async def delete_document(collection_name: str, filter_dict: Dict[str, Any]) -> int:
+    col: AsyncIOMotorCollection = db[collection_name]
+    res = await col.delete_one(filter_dict)
     return res.deleted_count
@@ -1,17 +1,25 @@
 import os
-from datetime import datetime, timedelta
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
 from typing import Optional, Dict, Any
 
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from pydantic import EmailStr
 import secrets
+import orjson
 from bson import ObjectId
+from bson.errors import InvalidId
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
 
-from database import db, create_document, get_documents, get_one, update_document
+from database import db, ensure_indexes, create_document, get_documents, get_one, update_document, now_ts
 from schemas import (
     UserCreate, UserLogin, Token, TokenData,
     ForgotPasswordRequest, ResetPasswordRequest,
@@ -23,37 +31,123 @@ SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 PRIMARY_ADMIN_EMAIL = os.getenv("PRIMARY_ADMIN_EMAIL", "myemail@domain.com").lower()
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+REDIS_URL = os.getenv("REDIS_URL")
+# Short so a slow or unreachable Redis falls back to Mongo instead of stalling requests
+REDIS_TIMEOUT_SECONDS = float(os.getenv("REDIS_TIMEOUT_SECONDS", "0.25"))
+# Comma-separated list of frontend origins allowed to call the API
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",") if o.strip()]
+
+pwd_hasher = PasswordHasher(time_cost=3, memory_cost=64 * 1024, parallelism=1)
+# Only used to verify bcrypt hashes stored before the switch to argon2id
+legacy_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+# Hashing is CPU-bound; run it off the event loop so other requests keep flowing
+_hash_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+# Optional user cache; without REDIS_URL every request reads the user from Mongo
+redis_client = (
+    aioredis.from_url(REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT_SECONDS, socket_timeout=REDIS_TIMEOUT_SECONDS)
+    if REDIS_URL else None
+)
 
 app = FastAPI(title="PortfolioPal API")
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
 )
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    if hashed_password.startswith("$argon2"):
+        try:
+            return pwd_hasher.verify(hashed_password, plain_password)
+        except (VerificationError, InvalidHashError):
+            return False
+    try:
+        return legacy_pwd_context.verify(plain_password, hashed_password)
+    except ValueError:
+        return False
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_hasher.hash(password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    if not hashed_password.startswith("$argon2"):
+        return True
+    return pwd_hasher.check_needs_rehash(hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, get_password_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, verify_password, plain_password, hashed_password)
+
+
+@app.on_event("startup")
+async def startup_indexes():
+    await ensure_indexes()
+
+
+@app.on_event("shutdown")
+def shutdown_hash_pool():
+    _hash_pool.shutdown(wait=False, cancel_futures=True)
+
+
+@app.on_event("shutdown")
+async def shutdown_redis():
+    if redis_client is not None:
+        await redis_client.aclose()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    expire = now_ts() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def _user_cache_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+async def cache_user(user: Dict[str, Any]) -> None:
+    if redis_client is None:
+        return
+    cached = {k: v for k, v in user.items() if k != "password"}
+    try:
+        await redis_client.setex(_user_cache_key(user["_id"]), ACCESS_TOKEN_EXPIRE_MINUTES * 60, orjson.dumps(cached))
+    except RedisError:
+        # Cache is best-effort
+        pass
+
+
+async def get_cached_user(user_id: str) -> Optional[Dict[str, Any]]:
+    if redis_client is None:
+        return None
+    try:
+        cached = await redis_client.get(_user_cache_key(user_id))
+    except RedisError:
+        return None
+    return orjson.loads(cached) if cached else None
+
+
+async def invalidate_cached_user(user_id: str) -> None:
+    if redis_client is None:
+        return
+    try:
+        await redis_client.delete(_user_cache_key(user_id))
+    except RedisError:
+        pass
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
     credentials_exception = HTTPException(status_code=401, detail="Could not validate credentials")
     try:
@@ -62,52 +156,71 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
         email: str = payload.get("email")
         if user_id is None or email is None:
             raise credentials_exception
-    except JWTError:
+        oid = ObjectId(user_id)
+    except (JWTError, InvalidId, TypeError):
         raise credentials_exception
-    filter_id: Any = ObjectId(user_id) if isinstance(user_id, str) and len(user_id) == 24 else user_id
-    user = db["user"].find_one({"_id": filter_id})
+    # Tokens issued before the is_admin claim existed fall back to the email check
+    admin = bool(payload["is_admin"]) if "is_admin" in payload else email.lower() == PRIMARY_ADMIN_EMAIL
+    cached = await get_cached_user(user_id)
+    if cached:
+        cached["is_admin"] = admin
+        return cached
+    user = await db["user"].find_one({"_id": oid})
     if not user:
         raise credentials_exception
     user["_id"] = str(user["_id"])  # normalize
+    user.pop("password", None)
+    user["is_admin"] = admin
+    await cache_user(user)
     return user
 
 
 def is_admin(user: Dict[str, Any]) -> bool:
-    return user.get("email", "").lower() == PRIMARY_ADMIN_EMAIL
+    return user.get("is_admin", False)
 
 
 # Auth routes
 @app.post("/api/auth/signup", response_model=Token)
-async def signup(payload: UserCreate, request: Request):
-    existing = get_one("user", {"email": payload.email.lower()})
+async def signup(payload: UserCreate, request: Request, background_tasks: BackgroundTasks):
+    existing = await get_one("user", {"email": payload.email.lower()})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed = get_password_hash(payload.password)
-    user_id = create_document("user", {"email": payload.email.lower(), "password": hashed, "name": payload.name or ""})
-    token = create_access_token({"user_id": user_id, "email": payload.email.lower()})
+    hashed = await hash_password_async(payload.password)
+    email = payload.email.lower()
+    admin = email == PRIMARY_ADMIN_EMAIL
+    user_id = await create_document("user", {"email": email, "password": hashed, "name": payload.name or "", "is_admin": admin})
+    token = create_access_token({"user_id": user_id, "email": email, "is_admin": admin})
     csrf = secrets.token_urlsafe(16)
-    create_document("activity", {"user_id": user_id, "type": "signup", "ip": request.client.host})
+    background_tasks.add_task(create_document, "activity", {"user_id": ObjectId(user_id), "type": "signup", "ip": request.client.host})
     return {"access_token": token, "token_type": "bearer", "csrf_token": csrf}
 
 
 @app.post("/api/auth/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), request: Request = None):
-    user = get_one("user", {"email": form_data.username.lower()})
-    if not user or not verify_password(form_data.password, user.get("password", "")):
+async def login(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends(), request: Request = None):
+    user = await get_one("user", {"email": form_data.username.lower()})
+    if not user or not await verify_password_async(form_data.password, user.get("password", "")):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    token = create_access_token({"user_id": user["_id"], "email": user["email"]})
+    if password_needs_rehash(user["password"]):
+        # Lazily migrate legacy bcrypt hashes (or outdated argon2 params) on successful login
+        await update_document("user", {"_id": ObjectId(user["_id"])}, {"password": await hash_password_async(form_data.password)})
+    # Recompute from PRIMARY_ADMIN_EMAIL so changing it grants/revokes admin at next login
+    admin = user["email"] == PRIMARY_ADMIN_EMAIL
+    if user.get("is_admin") != admin:
+        await update_document("user", {"_id": ObjectId(user["_id"])}, {"is_admin": admin})
+    token = create_access_token({"user_id": user["_id"], "email": user["email"], "is_admin": admin})
+    await cache_user({**user, "is_admin": admin})
     csrf = secrets.token_urlsafe(16)
-    create_document("activity", {"user_id": user["_id"], "type": "login", "ip": request.client.host if request else None})
+    background_tasks.add_task(create_document, "activity", {"user_id": ObjectId(user["_id"]), "type": "login", "ip": request.client.host if request else None})
     return {"access_token": token, "token_type": "bearer", "csrf_token": csrf}
 
 
 @app.post("/api/auth/forgot-password")
 async def forgot_password(payload: ForgotPasswordRequest):
-    user = get_one("user", {"email": payload.email.lower()})
+    user = await get_one("user", {"email": payload.email.lower()})
     if user:
         token = secrets.token_urlsafe(32)
-        expires_at = datetime.utcnow() + timedelta(hours=1)
-        create_document("passwordreset", {"user_id": user["_id"], "token": token, "expires_at": expires_at})
+        expires_at = now_ts() + timedelta(hours=1)
+        await create_document("passwordreset", {"user_id": ObjectId(user["_id"]), "token": token, "expires_at": expires_at})
         # In a real app, send email here. For demo, return token.
         return {"message": "Reset email sent", "token": token}
     return {"message": "If an account exists, a reset email has been sent"}
@@ -115,16 +228,14 @@ async def forgot_password(payload: ForgotPasswordRequest):
 
 @app.post("/api/auth/reset-password")
 async def reset_password(payload: ResetPasswordRequest):
-    recs = get_documents("passwordreset", {"token": payload.token}, limit=1)
-    if not recs:
+    rec = await get_one("passwordreset", {"token": payload.token})
+    if not rec:
         raise HTTPException(status_code=400, detail="Invalid token")
-    rec = recs[0]
-    if rec.get("expires_at") and rec["expires_at"] < datetime.utcnow():
+    if rec.get("expires_at") and rec["expires_at"] < now_ts():
         raise HTTPException(status_code=400, detail="Token expired")
-    hashed = get_password_hash(payload.new_password)
-    # convert id for matching
-    filter_id = ObjectId(rec["user_id"]) if isinstance(rec["user_id"], str) and len(rec["user_id"]) == 24 else rec["user_id"]
-    db["user"].update_one({"_id": filter_id}, {"$set": {"password": hashed, "updated_at": datetime.utcnow()}})
+    hashed = await hash_password_async(payload.new_password)
+    await db["user"].update_one({"_id": ObjectId(rec["user_id"])}, {"$set": {"password": hashed, "updated_at": now_ts()}})
+    await invalidate_cached_user(str(rec["user_id"]))
     return {"message": "Password updated"}
 
 
@@ -139,17 +250,29 @@ async def me(current = Depends(get_current_user)):
 async def admin_overview(current = Depends(get_current_user)):
     if not is_admin(current):
         raise HTTPException(status_code=403, detail="Access denied")
-    users = get_documents("user", {}, limit=1000)
-    activity = get_documents("activity", {}, limit=1000)
+    users, activity = await asyncio.gather(
+        get_documents("user", {}, limit=1000, projection={"password": 0}),
+        get_documents(
+            "activity", {}, limit=1000, sort=[("created_at", -1)],
+            projection={"user_id": 1, "type": 1, "created_at": 1, "ip": 1},
+        ),
+    )
+    for item in activity:
+        if "user_id" in item:
+            item["user_id"] = str(item["user_id"])
     return {"users": users, "activity": activity}
 
 
 # Activity logging helper endpoint (optional)
 @app.post("/api/activity")
-async def log_activity(log: ActivityLog, current = Depends(get_current_user)):
+async def log_activity(log: ActivityLog, background_tasks: BackgroundTasks, current = Depends(get_current_user)):
     if current["_id"] != log.user_id and not is_admin(current):
         raise HTTPException(status_code=403, detail="Forbidden")
-    create_document("activity", log.dict())
+    try:
+        user_oid = ObjectId(log.user_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+    background_tasks.add_task(create_document, "activity", {**log.model_dump(), "user_id": user_oid})
     return {"ok": True}
 
 
@@ -179,7 +302,7 @@ async def portfolio(payload: PortfolioInput):
         ],
         "skills": payload.skills,
     }
-    return {"result": __import__("json").dumps(result, ensure_ascii=False, indent=2)}
+    return {"result": orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()}
 
 
 @app.get("/test")
@@ -1,17 +1,24 @@
 import os
-from typing import List, Optional
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
+# Comma-separated list of frontend origins allowed to call the API
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",") if o.strip()]
+
 app = FastAPI(title="PortfolioPal API")
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
 )
 
 
@@ -52,24 +59,60 @@ class PortfolioInput(BaseModel):
 
 # --------- Helpers ---------
 
-def get_openai_client():
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "256"))
+
+# prompt sha1 -> (expires_at, text); identical requests build identical prompts
+_ai_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_ai_cache_lock = threading.Lock()
+
+
+def _ai_cache_get(key: str) -> Optional[str]:
+    with _ai_cache_lock:
+        entry = _ai_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _ai_cache[key]
+            return None
+        _ai_cache.move_to_end(key)
+        return entry[1]
+
+
+def _ai_cache_set(key: str, text: str) -> None:
+    with _ai_cache_lock:
+        _ai_cache[key] = (time.monotonic() + AI_CACHE_TTL_SECONDS, text)
+        _ai_cache.move_to_end(key)
+        while len(_ai_cache) > AI_CACHE_MAX_ENTRIES:
+            _ai_cache.popitem(last=False)
+
+
+def _create_openai_client():
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return None
     try:
-        from openai import OpenAI  # type: ignore
-        client = OpenAI(api_key=api_key)
+        from openai import AsyncOpenAI  # type: ignore
+        client = AsyncOpenAI(api_key=api_key)
         return client
     except Exception:
         return None
 
 
-def ai_generate(prompt: str) -> str:
+# Built once so every request reuses the same HTTP connection pool
+_OPENAI_CLIENT = _create_openai_client()
+
+
+async def ai_generate(prompt: str) -> str:
     """Generate text using OpenAI if available, otherwise fallback to a smart template."""
-    client = get_openai_client()
-    if client:
+    cache_key = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    cached = _ai_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    if _OPENAI_CLIENT:
         try:
-            resp = client.chat.completions.create(
+            resp = await _OPENAI_CLIENT.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are PortfolioPal, an expert portfolio and project description writer. Be concise, clear, and engaging."},
@@ -77,7 +120,9 @@ def ai_generate(prompt: str) -> str:
                 ],
                 temperature=0.7,
             )
-            return resp.choices[0].message.content or ""
+            text = resp.choices[0].message.content or ""
+            _ai_cache_set(cache_key, text)
+            return text
         except Exception:
             pass
 
@@ -106,7 +151,7 @@ def hello():
 
 
 @app.post("/api/ai/project-writer")
-def generate_project_writer(body: ProjectInput):
+async def generate_project_writer(body: ProjectInput):
     prompt = (
         f"Write a compelling, structured project description.\n"
         f"Title: {body.title}\n"
@@ -117,12 +162,12 @@ def generate_project_writer(body: ProjectInput):
         "Output format: \n"
         "- One-sentence hook\n- Problem & Motivation\n- Approach & Architecture\n- Key Features (bullet list)\n- Tech Stack\n- Impact & Results\n- What I learned\n"
     )
-    text = ai_generate(prompt)
+    text = await ai_generate(prompt)
     return {"result": text}
 
 
 @app.post("/api/ai/portfolio")
-def generate_portfolio(body: PortfolioInput):
+async def generate_portfolio(body: PortfolioInput):
     projects_text = "\n".join(
         [
             f"Project: {p.name}\nDesc: {p.description}\nHighlights: {', '.join(p.highlights or [])}\nTech: {', '.join(p.tech or [])}\nLink: {p.link or 'N/A'}"
@@ -146,7 +191,7 @@ def generate_portfolio(body: PortfolioInput):
         f"Skills: {skills_text}\n\n"
         "Output as JSON with keys: hero, about, projects (array with name, blurb, bullets, tech, link), education (array), skills (array), cta. Keep each text concise."
     )
-    text = ai_generate(prompt)
+    text = await ai_generate(prompt)
     return {"result": text}
 
 